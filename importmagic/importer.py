@@ -1,7 +1,6 @@
 """Imports new symbols."""
 
 import tokenize
-from collections import defaultdict
 
 from importmagic.six import StringIO
 
@@ -80,7 +79,7 @@ class Imports(object):
 
     def __init__(self, index, source):
         self._imports = set()
-        self._imports_from = defaultdict(set)
+        self._imports_from = {}
         self._imports_begin = self._imports_end = None
         self._source = source
         self._index = index
@@ -96,7 +95,10 @@ class Imports(object):
 
     def add_import_from(self, module, name, alias=None):
         location = LOCATION_ORDER.index(self._index.location_for(module))
-        self._imports_from[module].add(Import(location, name, alias))
+        imports = self._imports_from.get(module)
+        if imports is None:
+            imports = self._imports_from[module] = set()
+        imports.add(Import(location, name, alias))
 
     def remove(self, references):
         for imp in list(self._imports):
@@ -109,25 +111,28 @@ class Imports(object):
 
     def get_update(self):
         groups = []
+        # Sort once, rather than once per location group.
+        imports = sorted(self._imports)
+        imports_from = [(module, sorted(names))
+                        for module, names in sorted(self._imports_from.items())]
         for expected_location in range(len(LOCATION_ORDER)):
-            out = StringIO()
-            for imp in sorted(self._imports):
+            out = []
+            for imp in imports:
                 if expected_location != imp.location:
                     continue
-                out.write('import {module}{alias}\n'.format(
+                out.append('import {module}{alias}\n'.format(
                     module=imp.name,
                     alias=' as {alias}'.format(alias=imp.alias) if imp.alias else '',
                 ))
 
-            for module, imports in sorted(self._imports_from.items()):
-                imports = sorted(imports)
-                if not imports or expected_location != imports[0].location:
+            for module, names in imports_from:
+                if not names or expected_location != names[0].location:
                     continue
                 line = 'from {module} import '.format(module=module)
                 clauses = ['{name}{alias}'.format(
                            name=i.name,
                            alias=' as {alias}'.format(alias=i.alias) if i.alias else ''
-                           ) for i in imports]
+                           ) for i in names]
                 clauses.reverse()
                 line_len = len(line)
                 line_pieces = []
@@ -146,7 +151,7 @@ class Imports(object):
                         else:
                             # Use a backslash
                             line_tail = ', \\\n'
-                        out.write(line + imported_items + line_tail)
+                        out.append(line + imported_items + line_tail)
                         line = '    '
                         line_len = len(line) + len(clause) + 2
                         line_pieces = [clause]
@@ -155,11 +160,10 @@ class Imports(object):
                         line_len = next_len
                 line += ', '.join(line_pieces) + (')\n' if paren_used else '\n')
                 if line.strip():
-                    out.write(line)
+                    out.append(line)
 
-            text = out.getvalue()
-            if text:
-                groups.append(text)
+            if out:
+                groups.append(''.join(out))
 
         start = self._tokens[self._imports_begin][2][0] - 1
         end = self._tokens[min(len(self._tokens) - 1, self._imports_end)][2][0] - 1
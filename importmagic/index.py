@@ -4,13 +4,25 @@ import os
 import sys
 
 import ast
+import hashlib
+import hmac
 import json
 import logging
+import multiprocessing
+import pickle
 import re
+import stat
+import tempfile
 from contextlib import contextmanager
 from distutils import sysconfig
 
-from importmagic.util import parse_ast
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:  # Python 2 without the "futures" backport
+    ProcessPoolExecutor = None
+
+from importmagic.six.moves import intern
+from importmagic.util import get_visit_method, parse_ast
 
 
 LIB_LOCATIONS = sorted(set((
@@ -24,6 +36,11 @@ LIB_LOCATIONS = sorted(set((
 
 # Regex matching modules that we never attempt to index.
 DEFAULT_BLACKLIST_RE = re.compile(r'\btest[s]?|test[s]?\b', re.I)
+# Regex matching a line with code on it. Modules without any (eg. empty or
+# comment-only __init__.py files) can't define symbols, so aren't parsed.
+_CODE_LINE_PATTERN = r'^[ \t]*[^\s#]'
+_CODE_LINE_RE = re.compile(_CODE_LINE_PATTERN, re.M)
+_CODE_LINE_BYTES_RE = re.compile(_CODE_LINE_PATTERN.encode('ascii'), re.M)
 # Modules to treat as built-in.
 #
 # "os" is here mostly because it imports a whole bunch of aliases from other
@@ -33,6 +50,11 @@ BUILTIN_MODULES = sys.builtin_module_names + ('os',)
 
 _PYTHON_VERSION = 'python{}.{}'.format(sys.version_info.major, sys.version_info.minor)
 
+# Default directory for the per-module cache used by SymbolIndex.index_file().
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'importmagic')
+# Bump whenever what SymbolVisitor indexes, or the cached format, changes.
+_MODULE_CACHE_VERSION = 1
+
 LOCATION_BOOSTS = {
     '3': 1.2,
     'L': 1.5,
@@ -46,10 +68,35 @@ LOCATION_BOOSTS = {
 logger = logging.getLogger(__name__)
 
 
+def _block_child_fields():
+    """Map AST node classes to their fields holding lists of statements.
+
+    Only modules, statements, except handlers and match cases are included.
+    Expressions can't contain statements, so SymbolVisitor never needs to
+    descend into them.
+    """
+    block_fields = ('body', 'orelse', 'finalbody', 'handlers', 'cases')
+    pending = [ast.Module, ast.stmt, ast.excepthandler]
+    if hasattr(ast, 'match_case'):
+        pending.append(ast.match_case)
+    child_fields = {}
+    while pending:
+        cls = pending.pop()
+        pending.extend(cls.__subclasses__())
+        fields = tuple(f for f in cls._fields if f in block_fields)
+        if fields:
+            child_fields[cls] = fields
+    return child_fields
+
+
+_BLOCK_CHILD_FIELDS = _block_child_fields()
+
+
 class JSONEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, SymbolIndex):
-            d = o._tree.copy()
+            d = o._leaves.copy()
+            d.update(o._children)
             d.update(('.' + name, getattr(o, name))
                      for name in SymbolIndex._SERIALIZED_ATTRIBUTES)
             if o._lib_locations is not None:
@@ -58,7 +105,193 @@ class JSONEncoder(json.JSONEncoder):
         return super(JSONEncoder, self).default(o)
 
 
+def _sign(secret, payload):
+    return hmac.new(secret, payload, hashlib.sha256).digest()
+
+
+_SIGNATURE_SIZE = hashlib.sha256().digest_size
+
+
+def _dumps_signed(secret, obj):
+    """Pickle obj, prefixed with an HMAC of the pickle."""
+    payload = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    return _sign(secret, payload) + payload
+
+
+def _loads_signed(secret, content):
+    """Unpickle content written by _dumps_signed(), if its HMAC matches.
+
+    :raises ValueError: If the signature does not match.
+    """
+    signature, payload = content[:_SIGNATURE_SIZE], content[_SIGNATURE_SIZE:]
+    if not hmac.compare_digest(signature, _sign(secret, payload)):
+        raise ValueError('signature does not match')
+    return pickle.loads(payload)
+
+
+def owned_by_user(path):
+    """Whether path is owned, and only writable, by the current user."""
+    if not hasattr(os, 'getuid'):
+        # Windows: rely on signatures alone.
+        return True
+    st = os.stat(path)
+    return st.st_uid == os.getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _make_private_dir(path):
+    if not os.path.isdir(path):
+        os.makedirs(path, 0o700)
+
+
+# Secrets read by cache_secret(), by cache directory.
+_CACHE_SECRETS = {}
+
+
+def cache_secret(cache_dir):
+    """Return the per-user secret used to sign pickles in cache_dir.
+
+    The secret is created, readable only by the current user, on first use.
+
+    :raises ValueError: If the existing secret is not private to the user.
+    """
+    secret = _CACHE_SECRETS.get(cache_dir)
+    if secret is not None:
+        return secret
+    _make_private_dir(cache_dir)
+    filename = os.path.join(cache_dir, 'secret')
+    try:
+        fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except OSError:
+        if not owned_by_user(filename):
+            raise ValueError('%s is not private to the current user' % filename)
+        with open(filename, 'rb') as fp:
+            secret = fp.read()
+    else:
+        secret = os.urandom(32)
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(secret)
+    _CACHE_SECRETS[cache_dir] = secret
+    return secret
+
+
+def _intern(name):
+    """Intern a symbol name, so index lookups can compare by identity."""
+    # Python 2's intern() only accepts byte strings.
+    return intern(name) if type(name) is str else name
+
+
+def _module_cache_key(filename):
+    """Return a (path, mtime, size) key identifying the contents of filename."""
+    st = os.stat(filename)
+    return (os.path.abspath(filename), getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size)
+
+
+def _module_cache_filename(cache_dir, key):
+    cache_id = (_MODULE_CACHE_VERSION, sys.version_info[:2], key[0])
+    digest = hashlib.sha1(repr(cache_id).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, digest + '.pkl')
+
+
+def _load_cached_module(cache_dir, key):
+    """Return the cached (symbols, exports) for key, or None on a miss."""
+    filename = _module_cache_filename(cache_dir, key)
+    try:
+        if not owned_by_user(filename):
+            return None
+        with open(filename, 'rb') as fd:
+            content = fd.read()
+        cached_key, data = _loads_signed(cache_secret(cache_dir), content)
+    except Exception:
+        return None
+    if cached_key != key:
+        return None
+    return data
+
+
+def _replace_file(src, dst):
+    """Move src over dst, replacing any existing file."""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+        return
+    try:
+        os.rename(src, dst)
+    except OSError:
+        # Python 2 on Windows won't rename over an existing file.
+        os.unlink(dst)
+        os.rename(src, dst)
+
+
+def _store_cached_module(cache_dir, key, data):
+    filename = _module_cache_filename(cache_dir, key)
+    tmp_filename = None
+    try:
+        content = _dumps_signed(cache_secret(cache_dir), (key, data))
+        fd, tmp_filename = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(content)
+        _replace_file(tmp_filename, filename)
+    except Exception as e:
+        if tmp_filename is not None and os.path.exists(tmp_filename):
+            os.unlink(tmp_filename)
+        logger.debug('failed to cache index for %s: %s', key[0], e)
+
+
+class _PathEntry(object):
+    """A minimal stand-in for os.DirEntry, for arbitrary paths."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+
+    def is_file(self):
+        return os.path.isfile(self.path)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+
+@contextmanager
+def _scandir(path):
+    """Iterate over directory entries, using os.scandir() where possible.
+
+    os.scandir() caches file type information from the directory listing,
+    sparing a stat() per entry. The directory is closed on exit.
+    """
+    if hasattr(os, 'scandir'):
+        entries = os.scandir(path)
+    else:
+        entries = (_PathEntry(os.path.join(path, name)) for name in os.listdir(path))
+    try:
+        yield entries
+    finally:
+        # os.scandir() iterators only gained close() in Python 3.6.
+        if hasattr(entries, 'close'):
+            entries.close()
+
+
+def _parse_module(filename):
+    """Index the Python module filename in isolation.
+
+    This is a module-level function so that it can run in worker processes.
+
+    :returns: A tuple of (success, symbols, exports), suitable for caching.
+    """
+    logger.debug('parsing Python module %s for indexing', filename)
+    with open(filename, 'rb') as fd:
+        source = fd.read()
+    scratch = SymbolIndex._scratch()
+    success = scratch.index_source(filename, source)
+    return success, scratch._leaves, scratch._exports
+
+
 class SymbolIndex(object):
+    # Indexes contain tens of thousands of nodes, so avoid a __dict__ on each.
+    __slots__ = (
+        '_name', '_leaves', '_children', '_exports', '_parent', '_root',
+        '_blacklist_re', '_cache_dir', '_score_cache', 'score', 'location',
+        '_lib_locations', '_lib_location_prefixes', '_preparsed',
+    )
+
     PACKAGE_ALIASES = {
         # Give 'os.path' a score boost over posixpath and ntpath.
         'os.path': (os.path.__name__, 1.2),
@@ -73,25 +306,48 @@ class SymbolIndex(object):
     }
     _PACKAGE_ALIASES = dict((v[0], (k, v[1])) for k, v in PACKAGE_ALIASES.items())
     _SERIALIZED_ATTRIBUTES = {'score': 1.0, 'location': '3'}
+    # Maximum number of symbol_scores() results kept per index.
+    SCORE_CACHE_SIZE = 1024
+    # Bump whenever the format written by dump_pickle() changes.
+    _PICKLE_VERSION = 1
 
     def __init__(self, name=None, parent=None, score=1.0, location='L',
-                 blacklist_re=None, locations=None):
+                 blacklist_re=None, locations=None, cache_dir=None):
         self._name = name
-        self._tree = {}
+        # Symbols (name -> score) and subpackages (name -> SymbolIndex) are
+        # kept apart so that neither needs type checks when looked up.
+        self._leaves = {}
+        self._children = {}
         self._exports = {}
         self._parent = parent
+        self._root = parent._root if parent else self
         if blacklist_re:
             self._blacklist_re = blacklist_re
         elif parent:
             self._blacklist_re = parent._blacklist_re
         else:
             self._blacklist_re = DEFAULT_BLACKLIST_RE
+        if cache_dir is None and parent:
+            cache_dir = parent._cache_dir
+        self._cache_dir = cache_dir
+        # symbol_scores() results for the whole tree, keyed by (node, symbol).
+        # Cleared whenever any node is modified, or when it reaches
+        # SCORE_CACHE_SIZE entries.
+        self._score_cache = parent._score_cache if parent else {}
         self.score = score
         self.location = location
         if parent is None:
             self._lib_locations = locations or LIB_LOCATIONS
+            # Library directories with a trailing separator, so that they
+            # only match whole path components.
+            self._lib_location_prefixes = tuple(
+                (os.path.join(dir, ''), code) for dir, code in self._lib_locations)
+            # Modules parsed ahead of time by build_index(), by filename.
+            self._preparsed = {}
         else:
             self._lib_locations = None
+            self._lib_location_prefixes = parent._lib_location_prefixes
+            self._preparsed = None
         if parent is None:
             self._merge_aliases()
             with self.enter('__future__', location='F'):
@@ -99,11 +355,19 @@ class SymbolIndex(object):
             with self.enter('__builtin__', location='S'):
                 pass
 
+    @classmethod
+    def _scratch(cls):
+        """Return a detached node, just able to collect one module's symbols."""
+        node = cls.__new__(cls)
+        node._leaves = {}
+        node._children = {}
+        node._exports = {}
+        node._score_cache = {}
+        return node
+
     @property
     def lib_locations(self):
-        if self._parent:
-            return self._parent.lib_locations
-        return self._lib_locations
+        return self._root._lib_locations
 
     @classmethod
     def deserialize(self, file):
@@ -125,7 +389,44 @@ class SymbolIndex(object):
         load(tree, data, 'L')
         return tree
 
+    @classmethod
+    def load_pickle(cls, file, secret):
+        """Load an index written by dump_pickle().
+
+        The file is only unpickled once its signature has been verified, since
+        unpickling untrusted data can run arbitrary code.
+
+        :param secret: The secret the index was signed with.
+        :raises ValueError: If the signature does not match, or the index was
+            written in another format version.
+        """
+        # The pickled tree was already built, exports and all, so nodes are
+        # created directly rather than replaying add()/enter() per entry.
+        def load(tree, data):
+            _, _, tree._leaves, children = data
+            for key, value in children.items():
+                score, location = value[:2]
+                subtree = tree._children[key] = cls(key, tree, score=score, location=location)
+                load(subtree, value)
+
+        version, lib_locations, data = _loads_signed(secret, file.read())
+        if version != cls._PICKLE_VERSION:
+            raise ValueError('unsupported index version %r' % (version,))
+        tree = cls(locations=lib_locations)
+        tree._children = {}
+        load(tree, data)
+        # Restore the sharing enter() sets up between aliased packages.
+        for package_path, (alias_path, _) in cls._PACKAGE_ALIASES.items():
+            package, alias = tree.find(package_path), tree.find(alias_path)
+            if package is not None and alias is not None:
+                alias._leaves = package._leaves
+                alias._children = package._children
+        return tree
+
     def index_source(self, filename, source):
+        code_line_re = _CODE_LINE_BYTES_RE if isinstance(source, bytes) else _CODE_LINE_RE
+        if not code_line_re.search(source):
+            return True
         try:
             st = parse_ast(source, filename)
         except Exception as e:
@@ -135,36 +436,64 @@ class SymbolIndex(object):
         visitor.visit(st)
         return True
 
-    def index_file(self, module, filename):
-        if self._blacklist_re.search(filename):
-            return
-        logger.debug('parsing Python module %s for indexing', filename)
-        with open(filename, 'rb') as fd:
-            source = fd.read()
-        with self.enter(module, location=self._determine_location_for(filename)) as subtree:
-            success = subtree.index_source(filename, source)
+    def index_file(self, module, filename, location=None):
+        # Pre-parsed modules have already been checked against the blacklist.
+        data = self._root._preparsed.pop(filename, None)
+        if data is None:
+            if self._blacklist_re.search(filename):
+                return
+            data = self._load_module(filename)
+        if location is None:
+            location = self._determine_location_for(filename)
+        with self.enter(module, location=location) as subtree:
+            success, symbols, exports = data
+            subtree._exports.update(exports)
+            for name, score in symbols.items():
+                subtree.add(name, score)
         if not success:
-            self._tree.pop(module, None)
-
-    def index_path(self, root):
+            self._children.pop(module, None)
+            self._score_cache.clear()
+
+    def _load_module(self, filename):
+        """Parse filename, or fetch its symbols from the module cache."""
+        key = None
+        if self._cache_dir:
+            key = _module_cache_key(filename)
+            data = _load_cached_module(self._cache_dir, key)
+            if data is not None:
+                return data
+        data = _parse_module(filename)
+        if key is not None:
+            _store_cached_module(self._cache_dir, key, data)
+        return data
+
+    def index_path(self, root, location=None):
         """Index a path.
 
         :param root: Either a package directory, a .so or a .py module.
+        :param location: Location code for root, if already known.
         """
-        basename = os.path.basename(root)
-        if os.path.splitext(basename)[0] != '__init__' and basename.startswith('_'):
+        self._index_entry(_PathEntry(root), location)
+
+    def _index_entry(self, entry, location=None):
+        basename = entry.name
+        if basename.startswith('_') and os.path.splitext(basename)[0] != '__init__':
             return
-        location = self._determine_location_for(root)
-        if os.path.isfile(root):
+        root = entry.path
+        if location is None:
+            location = self._determine_location_for(root)
+        if entry.is_file():
             self._index_module(root, location)
-        elif os.path.isdir(root) and os.path.exists(os.path.join(root, '__init__.py')):
+        elif entry.is_dir() and os.path.exists(os.path.join(root, '__init__.py')):
             self._index_package(root, location)
 
     def _index_package(self, root, location):
         basename = os.path.basename(root)
         with self.enter(basename, location=location) as subtree:
-            for filename in os.listdir(root):
-                subtree.index_path(os.path.join(root, filename))
+            # Everything in a package shares its location.
+            with _scandir(root) as entries:
+                for entry in entries:
+                    subtree._index_entry(entry, location)
 
     def _index_module(self, root, location):
         basename, ext = os.path.splitext(os.path.basename(root))
@@ -175,7 +504,7 @@ class SymbolIndex(object):
         if import_path in BUILTIN_MODULES:
             return
         if ext == '.py':
-            self.index_file(basename, root)
+            self.index_file(basename, root, location)
         elif ext in ('.dll', '.so'):
             self.index_builtin(import_path, location=location)
 
@@ -195,16 +524,67 @@ class SymbolIndex(object):
                 if not key.startswith('_'):
                     subtree.add(key, 1.1)
 
-    def build_index(self, paths):
+    def build_index(self, paths, workers=1):
+        """Index builtin modules and all modules found in paths.
+
+        :param workers: Number of processes to parse modules with. Capped at
+            the number of CPUs.
+        """
         for builtin in BUILTIN_MODULES:
             self.index_builtin(builtin, location='S')
+        workers = min(workers, multiprocessing.cpu_count())
+        if workers > 1 and ProcessPoolExecutor is not None:
+            self._preparse_modules(paths, workers)
         for path in paths:
             # for the implicit "" entry in sys.path
             path = path or '.'
             if os.path.isdir(path):
-                for filename in os.listdir(path):
-                    filename = os.path.join(path, filename)
-                    self.index_path(filename)
+                with _scandir(path) as entries:
+                    for entry in entries:
+                        self._index_entry(entry)
+        self._root._preparsed.clear()
+
+    def _preparse_modules(self, paths, workers):
+        """Parse all Python modules in paths using a pool of processes.
+
+        The results are picked up by index_file() as the tree is built.
+        """
+        preparsed = self._root._preparsed
+        pending = []
+        for filename in self._find_module_files(paths):
+            key = data = None
+            if self._cache_dir:
+                key = _module_cache_key(filename)
+                data = _load_cached_module(self._cache_dir, key)
+            if data is None:
+                pending.append((filename, key))
+            else:
+                preparsed[filename] = data
+        # chunksize was only added to Executor.map() in Python 3.5.
+        options = {'chunksize': 16} if sys.version_info >= (3, 5) else {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_parse_module, [f for f, _ in pending], **options)
+            for (filename, key), data in zip(pending, results):
+                if key is not None:
+                    _store_cached_module(self._cache_dir, key, data)
+                preparsed[filename] = data
+
+    def _find_module_files(self, paths):
+        """Yield the .py files index_path() would visit for paths."""
+        for path in paths:
+            path = path or '.'
+            if not os.path.isdir(path):
+                continue
+            for root, dirs, files in os.walk(path, followlinks=True):
+                dirs[:] = [d for d in dirs if not d.startswith('_')
+                           and os.path.exists(os.path.join(root, d, '__init__.py'))]
+                for filename in files:
+                    basename, ext = os.path.splitext(filename)
+                    if ext.lower() != '.py' or (basename != '__init__' and basename.startswith('_')):
+                        continue
+                    filename = os.path.join(root, filename)
+                    if not self._blacklist_re.search(filename):
+                        yield filename
 
     def symbol_scores(self, symbol):
         """Find matches for symbol.
@@ -213,8 +593,13 @@ class SymbolIndex(object):
         :returns: A list of tuples of (score, package, reference|None),
             ordered by score from highest to lowest.
         """
+        cache_key = (self, symbol)
+        scores = self._score_cache.get(cache_key)
+        if scores is not None:
+            return list(scores)
+
         scores = []
-        path = []
+        full_key = tuple(_intern(key) for key in symbol.split('.'))
 
         # sys.path              sys path          ->    import sys
         # os.path.basename      os.path basename  ->    import os.path
@@ -224,9 +609,8 @@ class SymbolIndex(object):
             prefix = module.split('.')
             if variable is not None:
                 prefix.append(variable)
-            seeking = symbol.split('.')
             new_module = []
-            while prefix and seeking[0] != prefix[0]:
+            while prefix and full_key[0] != prefix[0]:
                 new_module.append(prefix.pop(0))
             if new_module:
                 module, variable = '.'.join(new_module), prefix[0]
@@ -234,28 +618,50 @@ class SymbolIndex(object):
                 variable = None
             return module, variable
 
-        def score_walk(scope, scale):
-            sub_path, score = self._score_key(scope, full_key)
+        stack = [(self, 1.0, ())]
+        while stack:
+            scope, scale, path = stack.pop()
+            # Scale only decays with depth, so nothing below here can
+            # contribute a meaningful score.
+            if scale <= 0.1:
+                continue
+
+            # Score full_key relative to scope. The first "matched" keys are
+            # packages, optionally followed by a variable if "leaf" is set.
+            matched = 0
+            leaf = False
+            boosts = []
+            score = 0.0
+            node = scope
+            for key in full_key:
+                leaf_score = node._leaves.get(key)
+                if leaf_score is not None:
+                    leaf = True
+                    score = leaf_score * node.boost()
+                    break
+                value = node._children.get(key)
+                if value is None:
+                    break
+                matched += 1
+                boosts.append((value.score, node.boost()))
+                node = value
+            for value_score, boost in reversed(boosts):
+                score = (score + value_score) * boost
+
             if score > 0.1:
-                try:
-                    i = sub_path.index(None)
-                    sub_path, from_symbol = sub_path[:i], '.'.join(sub_path[i + 1:])
-                except ValueError:
-                    from_symbol = None
-                package_path = '.'.join(path + sub_path)
+                package_path = '.'.join(path + full_key[:matched])
+                from_symbol = full_key[matched] if leaf else None
                 package_path, from_symbol = fixup(package_path, from_symbol)
                 scores.append((score * scale, package_path, from_symbol))
 
-            for key, subscope in scope._tree.items():
-                if type(subscope) is not float:
-                    path.append(key)
-                    score_walk(subscope, subscope.score * scale - 0.1)
-                    path.pop()
+            for key, subscope in scope._children.items():
+                stack.append((subscope, subscope.score * scale - 0.1, path + (key,)))
 
-        full_key = symbol.split('.')
-        score_walk(self, 1.0)
         scores.sort(reverse=True)
-        return scores
+        if len(self._score_cache) >= SymbolIndex.SCORE_CACHE_SIZE:
+            self._score_cache.clear()
+        self._score_cache[cache_key] = scores
+        return list(scores)
 
     def depth(self):
         depth = 0
@@ -280,62 +686,80 @@ class SymbolIndex(object):
     def find(self, path):
         """Return the node for a path, or None."""
         path = path.split('.')
-        node = self
-        while node._parent:
-            node = node._parent
+        node = self._root
         for name in path:
-            node = node._tree.get(name, None)
-            if node is None or type(node) is float:
+            node = node._children.get(name, None)
+            if node is None:
                 return None
         return node
 
     def location_for(self, path):
         """Return the location code for a path."""
         path = path.split('.')
-        node = self
-        while node._parent:
-            node = node._parent
+        node = self._root
         location = node.location
         for name in path:
-            tree = node._tree.get(name, None)
-            if tree is None or type(tree) is float:
+            tree = node._children.get(name, None)
+            if tree is None:
                 return location
             location = tree.location
         return location
 
     def add(self, name, score):
-        current_score = self._tree.get(name, 0.0)
-        if isinstance(current_score, float) and score > current_score:
-            self._tree[name] = score
+        name = _intern(name)
+        if name in self._children:
+            return
+        if score > self._leaves.get(name, 0.0):
+            self._leaves[name] = score
+            self._score_cache.clear()
 
     @contextmanager
     def enter(self, name, location='L', score=1.0):
         if name is None:
             tree = self
         else:
-            tree = self._tree.get(name)
-            if not isinstance(tree, SymbolIndex):
-                tree = self._tree[name] = SymbolIndex(name, self, score=score, location=location)
+            name = _intern(name)
+            tree = self._children.get(name)
+            if tree is None:
+                self._score_cache.clear()
+                self._leaves.pop(name, None)
+                tree = self._children[name] = SymbolIndex(name, self, score=score, location=location)
                 if tree.path() in SymbolIndex._PACKAGE_ALIASES:
                     alias_path, _ = SymbolIndex._PACKAGE_ALIASES[tree.path()]
                     alias = self.find(alias_path)
-                    alias._tree = tree._tree
+                    alias._leaves = tree._leaves
+                    alias._children = tree._children
         yield tree
         if tree._exports:
+            self._score_cache.clear()
             # Delete unexported variables
-            for key in set(tree._tree) - set(tree._exports):
-                del tree._tree[key]
+            for key in set(tree._leaves) - set(tree._exports):
+                del tree._leaves[key]
+            for key in set(tree._children) - set(tree._exports):
+                del tree._children[key]
 
     def serialize(self, fd=None):
         if fd is None:
             return json.dumps(self, cls=JSONEncoder)
         return json.dump(self, fd, cls=JSONEncoder)
 
+    def dump_pickle(self, file, secret):
+        """Write the index to a binary file, in a form faster to load than JSON.
+
+        :param secret: Bytes used to sign the index; see load_pickle().
+        """
+        def dump(tree):
+            return (tree.score, tree.location, tree._leaves,
+                    dict((key, dump(subtree)) for key, subtree in tree._children.items()))
+
+        data = (SymbolIndex._PICKLE_VERSION, self.lib_locations, dump(self))
+        file.write(_dumps_signed(secret, data))
+
     def boost(self):
         return LOCATION_BOOSTS.get(self.location, 1.0)
 
     def __repr__(self):
-        return '<%s:%r %r>' % (self.location, self.score, self._tree)
+        return '<%s:%r %r %r>' % (self.location, self.score, self._leaves, self._children)
 
     def _merge_aliases(self):
         def create(node, alias, score):
@@ -350,18 +774,6 @@ class SymbolIndex(object):
             package, score = SymbolIndex._PACKAGE_ALIASES[alias]
             create(self, package.split('.'), score)
 
-    def _score_key(self, scope, key):
-        if not key:
-            return [], 0.0
-        key_score = value = scope._tree.get(key[0], None)
-        if value is None:
-            return [], 0.0
-        if type(value) is float:
-            return [None, key[0]], key_score * scope.boost()
-        else:
-            path, score = self._score_key(value, key[1:])
-            return [key[0]] + path, (score + value.score) * scope.boost()
-
     def _determine_location_for(self, path):
         parts = path.split(os.path.sep)
         # Heuristic classifier
@@ -370,8 +782,8 @@ class SymbolIndex(object):
         elif _PYTHON_VERSION in parts:
             return 'S'
         # Use table from sysconfig.get_python_lib()
-        for dir, location in self.lib_locations:
-            if path.startswith(dir):
+        for prefix, location in self._lib_location_prefixes:
+            if path.startswith(prefix):
                 return location
         return 'L'
 
@@ -380,6 +792,16 @@ class SymbolVisitor(ast.NodeVisitor):
     def __init__(self, tree):
         self._tree = tree
 
+    def visit(self, node):
+        cls = type(self)
+        return get_visit_method(cls, node, cls.generic_visit)(self, node)
+
+    def generic_visit(self, node):
+        # Only statements can define symbols, so skip expression subtrees.
+        for field in _BLOCK_CHILD_FIELDS.get(node.__class__, ()):
+            for child in getattr(node, field):
+                self.visit(child)
+
     def visit_ImportFrom(self, node):
         for name in node.names:
             if name.name == '*' or name.name.startswith('_'):
@@ -400,6 +822,8 @@ class SymbolVisitor(ast.NodeVisitor):
         if not node.name.startswith('_'):
             self._tree.add(node.name, 1.1)
 
+    visit_AsyncFunctionDef = visit_FunctionDef
+
     def visit_Assign(self, node):
         # TODO: Handle __all__
         for name in [n for n in node.targets if isinstance(n, ast.Name)]:
@@ -419,5 +843,5 @@ class SymbolVisitor(ast.NodeVisitor):
 if __name__ == '__main__':
     # print ast.dump(ast.parse(open('pyautoimp.py').read(), 'pyautoimp.py'))
     tree = SymbolIndex()
-    tree.build_index(sys.path)
+    tree.build_index(sys.path, workers=multiprocessing.cpu_count())
     tree.serialize(sys.stdout)
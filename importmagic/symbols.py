@@ -8,7 +8,7 @@ from itertools import chain
 
 from importmagic.six import string_types
 from importmagic.six.moves import builtins
-from importmagic.util import parse_ast
+from importmagic.util import get_visit_method, parse_ast
 
 
 class _InvalidSymbol(Exception):
@@ -171,13 +171,9 @@ class UnknownSymbolVisitor(ast.NodeVisitor):
             return
         if self._trace:
             print(node, vars(node))
-        method = getattr(self, 'visit_%s' % node.__class__.__name__, None)
+        method = get_visit_method(type(self), node)
         if method is not None:
-            try:
-                method(node)
-            except Exception:
-                # print >> sys.stderr, node, vars(node)
-                raise
+            method(self, node)
         else:
             self.generic_visit(node)
             self._scope.end_symbol()
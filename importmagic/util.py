@@ -18,6 +18,25 @@ def parse_ast(source, filename=None):
     return ast.parse(source, filename or '<unknown>')
 
 
+def get_visit_method(cls, node, default=None):
+    """Return the visit_* function of NodeVisitor subclass cls for node.
+
+    Lookups are cached per class (not inherited by subclasses) and keyed by
+    node type, avoiding a getattr() with a formatted name for every node.
+
+    :param default: Returned when cls has no visit_* method for node.
+    """
+    cache = cls.__dict__.get('_visit_cache')
+    if cache is None:
+        cache = cls._visit_cache = {}
+    node_cls = node.__class__
+    try:
+        return cache[node_cls]
+    except KeyError:
+        method = cache[node_cls] = getattr(cls, 'visit_' + node_cls.__name__, default)
+        return method
+
+
 def dump(node, annotate_fields=True, include_attributes=False, indent='  '):
     """Return a formatted dump of the tree in *node*.
 
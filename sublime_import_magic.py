@@ -1,3 +1,4 @@
+import hashlib
 import os
 import sys
 
@@ -13,7 +14,8 @@ from distutils import sysconfig
 from threading import RLock, Thread
 
 from importmagic.importer import get_update
-from importmagic.index import LIB_LOCATIONS, SymbolIndex
+from importmagic.index import (
+    DEFAULT_CACHE_DIR, LIB_LOCATIONS, SymbolIndex, cache_secret, owned_by_user)
 from importmagic.symbols import Scope
 
 
@@ -22,6 +24,22 @@ def index_filename():
     return settings.get('index_filename', '.importmagic.idx')
 
 
+def cache_dir():
+    """Directory for user-private caches, or None if caching is disabled."""
+    settings = sublime.load_settings('Python Import Magic.sublime-settings')
+    directory = settings.get('module_cache_dir', DEFAULT_CACHE_DIR)
+    return os.path.expanduser(directory) if directory else None
+
+
+def pickled_index_filename(root):
+    """Pickled indexes are kept out of the project, so it can't supply one."""
+    directory = cache_dir()
+    if directory is None:
+        return None
+    digest = hashlib.sha1(root.encode('utf-8')).hexdigest()
+    return os.path.join(directory, 'index-{0}.pkl'.format(digest))
+
+
 def log(fmt, *args, **kwargs):
     text = fmt.format(*args, **kwargs)
     text = 'ImportMagic: {0}'.format(text)
@@ -40,11 +58,14 @@ class Indexer(object):
     def rebuild(self, root):
         log('Rebuilding index for {0}', root)
         with self._lock:
-            index_file = os.path.join(root, index_filename())
-            try:
-                os.unlink(index_file)
-            except OSError:
-                pass
+            for index_file in (os.path.join(root, index_filename()),
+                               pickled_index_filename(root)):
+                if index_file is None:
+                    continue
+                try:
+                    os.unlink(index_file)
+                except OSError:
+                    pass
             try:
                 del self._indexes[root]
             except KeyError:
@@ -78,23 +99,59 @@ class Indexer(object):
         print(locations)
 
         sublime.status_message('Loading index {0}'.format(root))
-        if os.path.exists(index_file):
-            log('Loading index for {0}', root)
-            with open(index_file) as fd:
-                index = SymbolIndex.deserialize(fd)
-        else:
-            index = SymbolIndex(locations=locations)
+        index = self._load(root, index_file)
+        if index is None:
+            index = SymbolIndex(locations=locations, cache_dir=cache_dir())
             paths = self._make_python_path(root, locations=locations)
             log('Indexing {0} with paths {1}',
                 root, os.path.pathsep.join(paths))
             index.build_index(paths)
             with open(index_file, 'w') as fd:
                 fd.write(index.serialize())
+            self._save_pickle(root, index)
         with self._lock:
             self._indexes[root] = index
             del self._threads[root]
         log('Ready for {0}', root, status=True)
 
+    def _load(self, root, index_file):
+        if not os.path.exists(index_file):
+            # Also covers the JSON index being deleted to force a reindex.
+            return None
+        pickle_file = pickled_index_filename(root)
+        if pickle_file is not None and os.path.exists(pickle_file):
+            log('Loading index for {0}', root)
+            try:
+                # Only trust a cached copy at least as new as the project's.
+                if owned_by_user(pickle_file) and \
+                        os.path.getmtime(pickle_file) >= os.path.getmtime(index_file):
+                    with open(pickle_file, 'rb') as fd:
+                        return SymbolIndex.load_pickle(fd, cache_secret(cache_dir()))
+            except Exception as e:
+                log('Ignoring cached index {0}: {1}', pickle_file, e)
+        # The JSON index kept in the project is slower to load, but safe.
+        log('Loading index for {0}', root)
+        try:
+            with open(index_file) as fd:
+                index = SymbolIndex.deserialize(fd)
+        except Exception:
+            log('Failed to load index {0}, rebuilding', index_file)
+            return None
+        self._save_pickle(root, index)
+        return index
+
+    def _save_pickle(self, root, index):
+        pickle_file = pickled_index_filename(root)
+        if pickle_file is None:
+            return
+        try:
+            secret = cache_secret(cache_dir())
+            fd = os.open(pickle_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as fp:
+                index.dump_pickle(fp, secret)
+        except Exception as e:
+            log('Failed to cache index {0}: {1}', pickle_file, e)
+
     def _make_python_path(self, root, locations):
         paths = [p[0] for p in locations]
         if root not in paths:
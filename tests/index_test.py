@@ -1,10 +1,17 @@
 from __future__ import absolute_import
 
 import json
+import os
 import re
+import stat
+from io import BytesIO
 from textwrap import dedent
 
-from importmagic.index import SymbolIndex
+import pytest
+
+from importmagic import index as index_module
+from importmagic.index import SymbolIndex, SymbolVisitor
+from importmagic.util import parse_ast
 from importmagic.six import b
 
 
@@ -14,7 +21,7 @@ def serialize(tree):
 
 def test_index_basic_api(index):
     assert index.depth() == 0
-    subtree = index._tree['os']
+    subtree = index._children['os']
     assert subtree.depth() == 1
     assert index.location_for('os.path') == subtree.location_for('os.path')
     assert index.find('os.walk') == subtree.find('os.walk')
@@ -40,7 +47,7 @@ def test_index_filesystem(tmpdir):
     pkg.join('syntaxerr.py').write('def func3():\n')
     tree = SymbolIndex(blacklist_re=re.compile('mytest_'))
     tree.build_index([str(tmpdir)])
-    subtree = tree._tree['pkg']
+    subtree = tree._children['pkg']
     assert serialize(subtree) == {
         ".location": "L",
         ".score": 1.0,
@@ -51,6 +58,104 @@ def test_index_filesystem(tmpdir):
                     "foo": 1.1}}
 
 
+def test_index_file_cache(tmpdir, monkeypatch):
+    cache_dir = str(tmpdir.join('cache'))
+    module = tmpdir.join('mod.py')
+    module.write('def func():\n pass\n')
+
+    tree = SymbolIndex(blacklist_re=re.compile('^$'), cache_dir=cache_dir)
+    tree.index_file('mod', str(module))
+    assert 'func' in tree._children['mod']._leaves
+
+    def fail(*args):
+        raise AssertionError('cached module should not be parsed')
+
+    monkeypatch.setattr(SymbolIndex, 'index_source', fail)
+    tree = SymbolIndex(blacklist_re=re.compile('^$'), cache_dir=cache_dir)
+    tree.index_file('mod', str(module))
+    assert serialize(tree._children['mod']) == {".location": "L", ".score": 1.0, "func": 1.1}
+
+    # Changing the module invalidates its cache entry.
+    monkeypatch.undo()
+    module.write('def other_func():\n pass\n')
+    tree = SymbolIndex(blacklist_re=re.compile('^$'), cache_dir=cache_dir)
+    tree.index_file('mod', str(module))
+    assert serialize(tree._children['mod']) == {".location": "L", ".score": 1.0, "other_func": 1.1}
+
+    # The stale entry was replaced, so the changed module is cached too.
+    monkeypatch.setattr(SymbolIndex, 'index_source', fail)
+    tree = SymbolIndex(blacklist_re=re.compile('^$'), cache_dir=cache_dir)
+    tree.index_file('mod', str(module))
+    assert serialize(tree._children['mod']) == {".location": "L", ".score": 1.0, "other_func": 1.1}
+
+    # Entries from another cache version are ignored.
+    monkeypatch.undo()
+    monkeypatch.setattr(index_module, '_MODULE_CACHE_VERSION', -1)
+    monkeypatch.setattr(SymbolIndex, 'index_source', fail)
+    tree = SymbolIndex(blacklist_re=re.compile('^$'), cache_dir=cache_dir)
+    with pytest.raises(AssertionError):
+        tree.index_file('mod', str(module))
+
+
+def test_index_filesystem_in_parallel(tmpdir):
+    pkg = tmpdir.mkdir('pkg')
+    pkg.join('__init__.py').write('class Cls:\n pass\n')
+    pkg.join('submod.py').write('def func():\n pass\n')
+    pkg.join('syntaxerr.py').write('def func3():\n')
+    subpkg = pkg.mkdir('subpkg')
+    subpkg.join('__init__.py').write('__all__ = ["one"]\none = two = 1\n')
+    blacklist_re = re.compile('^$')
+    serial = SymbolIndex(blacklist_re=blacklist_re)
+    serial.build_index([str(tmpdir)])
+    parallel = SymbolIndex(blacklist_re=blacklist_re)
+    parallel.build_index([str(tmpdir)], workers=2)
+    assert serialize(parallel._children['pkg']) == serialize(serial._children['pkg'])
+    assert serialize(parallel._children['pkg']) == {
+        ".location": "L", ".score": 1.0, "Cls": 1.1,
+        "submod": {".location": "L", ".score": 1.0, "func": 1.1},
+        "subpkg": {".location": "L", ".score": 1.0, "one": 1.2}}
+
+
+def test_index_subtree_in_parallel(tmpdir, monkeypatch):
+    monkeypatch.setattr(index_module.multiprocessing, 'cpu_count', lambda: 2)
+    tmpdir.join('mod.py').write('def func():\n pass\n')
+    tree = SymbolIndex(blacklist_re=re.compile('^$'))
+    with tree.enter('vendor') as subtree:
+        subtree.build_index([str(tmpdir)], workers=2)
+    assert tree.find('vendor.mod')._leaves == {'func': 1.1}
+    assert not tree._preparsed
+
+
+def test_index_location_matches_whole_directories(tmpdir):
+    for name in ('lib', 'libextra'):
+        tmpdir.mkdir(name).join('mod%s.py' % name).write('def func():\n pass\n')
+    tree = SymbolIndex(blacklist_re=re.compile('^$'), locations=[(str(tmpdir.join('lib')), 'S')])
+    tree.build_index([str(tmpdir.join('lib')), str(tmpdir.join('libextra'))])
+    assert tree.location_for('modlib') == 'S'
+    assert tree.location_for('modlibextra') == 'L'
+
+
+def test_index_file_cache_is_private(tmpdir, monkeypatch):
+    cache_dir = str(tmpdir.join('cache'))
+    module = tmpdir.join('mod.py')
+    module.write('def func():\n pass\n')
+    tree = SymbolIndex(blacklist_re=re.compile('^$'), cache_dir=cache_dir)
+    tree.index_file('mod', str(module))
+    if hasattr(os, 'getuid'):
+        assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    cached = [f for f in os.listdir(cache_dir) if f.endswith('.pkl')]
+    assert len(cached) == 1
+
+    # Tampered entries fail their signature check and are re-parsed.
+    with open(os.path.join(cache_dir, cached[0]), 'r+b') as fd:
+        fd.write(b('x'))
+    parsed = []
+    monkeypatch.setattr(SymbolIndex, 'index_source', lambda self, *args: parsed.append(args) or True)
+    tree = SymbolIndex(blacklist_re=re.compile('^$'), cache_dir=cache_dir)
+    tree.index_file('mod', str(module))
+    assert len(parsed) == 1
+
+
 def test_index_file_with_all():
     src = dedent('''
         __all__ = ['one']
@@ -78,6 +183,49 @@ def test_index_if_name_main():
     assert serialize(subtree) == {".location": "L", ".score": 1.0}
 
 
+def test_index_nested_statements_only():
+    src = dedent('''
+        try:
+            import json
+        except ImportError:
+            import simplejson as json
+
+        class Cls:
+            inner = 1
+
+        print([lambda: x for x in range(10)])
+        ''')
+    tree = SymbolIndex()
+    with tree.enter('test') as subtree:
+        subtree.index_source('test.py', src)
+    assert serialize(subtree) == {".location": "L", ".score": 1.0,
+                                  "json": 0.25, "simplejson": 0.25, "Cls": 1.1}
+
+
+def test_index_source_without_code():
+    tree = SymbolIndex()
+    with tree.enter('test') as subtree:
+        assert subtree.index_source('test.py', '\n  # import os\n\n')
+        assert subtree.index_source('test.py', b(''))
+    assert serialize(subtree) == {".location": "L", ".score": 1.0}
+
+
+def test_index_source_one_line_statements():
+    tree = SymbolIndex()
+    with tree.enter('test') as subtree:
+        assert subtree.index_source('test.py', 'try: import json\nexcept ImportError: pass\n')
+        assert subtree.index_source('test.py', 'with x: import zlib\n')
+        assert subtree.index_source('test.py', b('"""doc"""; import os\n'))
+    assert serialize(subtree) == {".location": "L", ".score": 1.0,
+                                  "json": 0.25, "zlib": 0.25, "os": 0.25}
+
+
+def test_index_source_invalid_without_symbols():
+    tree = SymbolIndex()
+    with tree.enter('test') as subtree:
+        assert not subtree.index_source('test.py', 'x = (\n')
+
+
 def test_index_symbol_scores():
     src = dedent('''
         def walk(dir): pass
@@ -91,6 +239,27 @@ def test_index_symbol_scores():
     assert tree.symbol_scores('os.path.walk') == [(5.25, 'os.path', None)]
 
 
+def test_index_symbol_scores_cache_invalidated():
+    tree = SymbolIndex()
+    with tree.enter('os') as os_tree:
+        os_tree.add('walk', 1.1)
+    scores = tree.symbol_scores('walk')
+    assert scores[0][1:] == ('os', 'walk')
+    scores.pop()
+    assert tree.symbol_scores('walk')[0][1:] == ('os', 'walk')
+    with tree.enter('shutil') as shutil_tree:
+        shutil_tree.add('walk', 2.0)
+    assert tree.symbol_scores('walk')[0][1:] == ('shutil', 'walk')
+
+
+def test_index_symbol_scores_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(SymbolIndex, 'SCORE_CACHE_SIZE', 2)
+    tree = SymbolIndex()
+    for symbol in ('a', 'b', 'c', 'd', 'e'):
+        tree.symbol_scores(symbol)
+        assert len(tree._score_cache) <= 2
+
+
 def test_index_score_deep_unknown_attribute(index):
     assert index.symbol_scores('os.path.basename.unknown')[0][1:] == ('os.path', None)
 
@@ -114,3 +283,39 @@ def test_encoding_score(index):
 def test_score_boosts_apply_to_scopes(index):
     print(index.symbol_scores('basename'))
     assert index.symbol_scores('basename')[0][1:] == ('os.path', 'basename')
+
+
+def test_visitor_dispatch_cache_is_per_class():
+    class NoAssignVisitor(SymbolVisitor):
+        def visit_Assign(self, node):
+            pass
+
+    st = parse_ast('one = 1\n')
+    tree = SymbolIndex()
+    with tree.enter('plain') as subtree:
+        SymbolVisitor(subtree).visit(st)
+    with tree.enter('noassign') as subtree:
+        NoAssignVisitor(subtree).visit(st)
+    assert serialize(tree._children['plain']) == {".location": "L", ".score": 1.0, "one": 1.1}
+    assert serialize(tree._children['noassign']) == {".location": "L", ".score": 1.0}
+
+
+def test_pickle_round_trip(index):
+    fd = BytesIO()
+    index.dump_pickle(fd, b('secret'))
+    fd.seek(0)
+    loaded = SymbolIndex.load_pickle(fd, b('secret'))
+    assert serialize(loaded) == serialize(index)
+    for symbol in ('os.path.basename', 'basename', 'sys.path', 'iso8859_6.Codec'):
+        assert loaded.symbol_scores(symbol) == index.symbol_scores(symbol)
+    # Aliased packages share their contents, as when built with enter().
+    assert loaded.find('os.path')._leaves is loaded.find('posixpath')._leaves
+    assert loaded.location_for('os.path') == index.location_for('os.path')
+
+
+def test_pickle_rejects_bad_signature(index):
+    fd = BytesIO()
+    index.dump_pickle(fd, b('secret'))
+    fd.seek(0)
+    with pytest.raises(ValueError):
+        SymbolIndex.load_pickle(fd, b('other'))